@@ -6,11 +6,16 @@ from utils.lead_merger import LeadMerger
 from utils.lead_scorer import LeadScorer
 from utils.stats_mapper import StatsMapper
 from utils.cold_call_generator import ColdCallGenerator
+from utils.quota_planner import PlacesQuotaPlanner
+from utils.territory_loader import TerritoryLoader
+from utils.cache_warmer import TerritoryCache, CacheWarmer
+from utils.lead_exporter import LeadExporter
+from utils.route_planner import WalkInRoutePlanner
+from utils.score_memo import ScoredViewCache
 import requests
 from utils.naics_keyword_map import NAICSKeywordMap
 from datetime import datetime
 import time # For potential delays or spinners
-import re # For extracting postal codes
 
 # --- App Configuration ---
 st.set_page_config(page_title="Canadian Linen LeadGen", layout="wide")
@@ -19,13 +24,15 @@ st.title("🧼 Canadian Linen - Compliance-Based Lead Generator")
 # --- Initialize Modules ---
 # Wrap in try-except for potential API key issues or file not found
 try:
-    naics_mapper = NAICSKeywordMap()
+    naics_mapper = NAICSKeywordMap(fuzzy_fallback=True) # Fuzzy fallback for misspelled/inflected business names
     google_scraper = GooglePlacesScraper()
     registry_fetcher = CalgaryRegistryFetcher()
     merger = LeadMerger()
     scorer = LeadScorer()
     stats_mapper = StatsMapper()
     script_gen = ColdCallGenerator()
+    quota_planner = PlacesQuotaPlanner()
+    route_planner = WalkInRoutePlanner(time_cap=0.4)
 except ValueError as e:
     st.error(f"🚨 Initialization Error: {e}. Please ensure the GOOGLE_API_KEY is set correctly in Streamlit secrets.")
     st.stop()
@@ -37,79 +44,79 @@ except Exception as e:
      st.stop()
 
 
-# --- Helper Function for Postal Code Extraction ---
-def extract_postal_code(address):
-    if not isinstance(address, str):
-        return None
-    # Canadian Postal Code Regex (allows for formats like T2X 1Y4 or T2X1Y4)
-    match = re.search(r'[ABCEGHJKLMNPRSTVXY]\d[A-Z]\s?\d[A-Z]\d', address.upper())
-    return match.group(0).replace(" ", "") if match else None # Return normalized (no space)
+SEARCH_RADIUS = 10000 # Google search radius in metres
 
-# --- Cached Data Loading and Classification Function ---
-@st.cache_data(ttl=3600, show_spinner="Fetching and classifying businesses in territory...") # Cache for 1 hour
-def load_and_classify_leads(_postal_prefixes, _location):
+# --- Shared Territory Cache (one per app process, shared by all sessions) ---
+@st.cache_resource
+def get_cache_warmer():
     """
-    Fetches leads from Google (broadly) and Registry, merges them,
-    classifies using NAICS map, and returns a DataFrame.
-    Underscores in args tell Streamlit cache to ignore them if they are mutable lists/dicts.
+    Builds the process-wide cache warmer. Territories listed in
+    data/warm_territories.json are pre-loaded on a schedule in a daemon thread;
+    stale entries are served immediately while they refresh in the background.
     """
-    print(f"CACHE MISS: Loading data for postal prefixes: {_postal_prefixes}, location: {_location}") # Log cache miss
-    google_leads = []
-    registry_leads = []
-    try:
-        # Google Scraping (Broad) - Radius can be adjusted
-        google_leads = google_scraper.search_businesses_broadly(_location, radius=10000) # Using the new broad search
-        st.write(f"Found {len(google_leads)} potential leads from Google.") # Progress update
-
-        # Registry Fetching
-        registry_leads = registry_fetcher.fetch_by_postal(_postal_prefixes)
-        st.write(f"Found {len(registry_leads)} potential leads from Calgary Registry.") # Progress update
-
-    except requests.exceptions.RequestException as e:
-        st.error(f"🚨 Network Error during data fetching: {e}. Please check connection and API keys.")
-        return pd.DataFrame() # Return empty DataFrame on error
-    except Exception as e:
-        st.error(f"🚨 Error during data fetching: {e}")
-        return pd.DataFrame() # Return empty DataFrame on error
-
-    # Merge & Deduplicate
-    st.write("Merging and deduplicating leads...")
-    combined_leads = merger.merge(google_leads, registry_leads)
-    st.write(f"Total unique leads after merging: {len(combined_leads)}")
-
-    if not combined_leads:
-        st.warning("⚠️ No leads found for the specified territory.")
-        return pd.DataFrame()
-
-    # Classify, Add Compliance, and Extract Postal Codes
-    st.write("Classifying leads by industry (NAICS)...")
-    processed_leads = []
-    for lead in combined_leads:
-        # Ensure essential fields exist
-        lead_text = f"{lead.get('business_name', '')} {lead.get('address', '')}"
-        naics_code, industry, compliance_tags = naics_mapper.guess_naics_from_text(lead_text)
-
-        lead['naics_code'] = naics_code
-        lead['industry'] = industry if industry else "Unknown" # Default to Unknown if None
-        # Get additional details based on guessed NAICS
-        naics_details = naics_mapper.get_details_from_naics(naics_code) if naics_code else None
-        lead['compliance'] = naics_details.get('compliance', []) if naics_details else [] # Store as list
-        lead['awrv_tier'] = naics_details.get('awrv_tier', 'Unknown') if naics_details else 'Unknown'
-
-        # Standardize/Extract Postal Code
-        if 'postal_code' not in lead or not lead['postal_code']:
-             lead['postal_code'] = extract_postal_code(lead.get('address',''))
+    loader = TerritoryLoader(naics_mapper, google_scraper, registry_fetcher, merger, quota_planner, radius=SEARCH_RADIUS)
+    warmer = CacheWarmer(loader, TerritoryCache(fresh_ttl=3600)) # Fresh for 1 hour
+    warmer.start()
+    return warmer
+
+cache_warmer = get_cache_warmer()
+
+@st.cache_resource
+def get_lead_exporter():
+    """Process-wide export cache so identical filtered downloads are built once."""
+    return LeadExporter()
+
+lead_exporter = get_lead_exporter()
+
+@st.cache_resource
+def get_scored_view_cache():
+    """Process-wide LRU of scored display frames, so flipping between filter combinations is a lookup."""
+    return ScoredViewCache(max_entries=32)
+
+scored_view_cache = get_scored_view_cache()
+
+def score_filtered_leads(df_filtered, rep_name):
+    """Scores leads and generates scripts for the filtered rows. Keeps df_filtered's index."""
+    processed_leads_display = []
+
+    with st.spinner("Scoring leads and generating scripts..."):
+        # Using apply might be cleaner but requires scorer/script_gen adjustments. Loop for now.
+        for index, lead_row in df_filtered.iterrows():
+             lead_dict = lead_row.to_dict()
+             try:
+                 # Get zone density for scoring
+                 zone_density = stats_mapper.get_density_score(lead_dict.get("postal_code", ""), lead_dict.get("naics_code", ""))
+                 # Score lead (assuming score_lead returns the updated dict)
+                 # Pass a copy to avoid modifying the original dict within the loop implicitly
+                 scored_lead = scorer.score_lead(lead_dict.copy(), zone_density_score=zone_density)
+                 # Generate script (assuming generate returns the script string)
+                 # Pass a copy of the *scored* lead data
+                 scored_lead["Cold Call Script"] = script_gen.generate(scored_lead.copy(), rep_name=rep_name)
+                 processed_leads_display.append(scored_lead)
+             except Exception as e:
+                 st.error(f"Error processing lead {lead_dict.get('business_name')}: {e}")
+                 processed_leads_display.append(lead_dict) # Append original dict on error
+
+    if processed_leads_display:
+         df_display = pd.DataFrame(processed_leads_display, index=df_filtered.index)
+    else:
+         # If processing failed for all, show the filtered columns but no data
+         df_display = pd.DataFrame(columns=df_filtered.columns)
 
-        processed_leads.append(lead)
+    # Ensure 'compliance' column is display-friendly (e.g., comma-separated string)
+    if 'compliance' in df_display.columns:
+         df_display['compliance_display'] = df_display['compliance'].apply(lambda x: ', '.join(x) if isinstance(x, list) else x)
+    return df_display
 
-    df = pd.DataFrame(processed_leads)
-    # Ensure key columns exist, even if empty after processing
-    required_cols = ["business_name", "address", "postal_code", "industry", "compliance", "naics_code", "awrv_tier", "maps_link", "source"]
-    for col in required_cols:
-        if col not in df.columns:
-            df[col] = None if col != 'compliance' else pd.Series([[] for _ in range(len(df))]) # Initialize compliance as empty list
+ROUTE_FIELDS = ("business_name", "latitude", "longitude", "postal_code", "maps_link")
 
-    return df
+@st.cache_data(max_entries=16, show_spinner="Optimizing walk-in route...")
+def plan_walk_in_route(route_stops):
+    """
+    Orders leads into a walk-in route. route_stops is a tuple of ROUTE_FIELDS tuples
+    so the cache key stays cheap to hash and the route is only re-planned when stops change.
+    """
+    return route_planner.plan([dict(zip(ROUTE_FIELDS, stop)) for stop in route_stops])
 
 
 # --- Sidebar Controls ---
@@ -127,8 +134,22 @@ except ValueError:
 
 
 st.sidebar.header("🚀 Load Territory Data")
+max_calls = len(naics_mapper.get_broad_search_categories()) * 3 # 60 results per category = 3 pages
+call_budget = st.sidebar.number_input("Google Places call budget", min_value=1, max_value=max_calls, value=max_calls, step=1,
+                                      help="Calls are spent on the categories that historically return the most new, classifiable leads for this area.")
+# Show the forecast before anything is spent
+search_plan = google_scraper.plan_broad_search(location, radius=SEARCH_RADIUS, planner=quota_planner, call_budget=call_budget)
+forecast = quota_planner.forecast(quota_planner.area_key(location, SEARCH_RADIUS), search_plan)
+st.sidebar.caption(
+    f"Forecast: {forecast['calls']} Google calls (~{forecast['estimated_cost_usd']:.2f} USD), "
+    f"~{forecast['expected_new_leads']} new leads, ~{forecast['expected_relevant_leads']} classifiable"
+    + ("" if forecast['has_history'] else " (no history for this area yet)")
+)
 generate_btn = st.sidebar.button("Load Businesses in Territory")
 
+st.sidebar.header("🗣️ Call Scripts")
+rep_name = st.sidebar.text_input("Your Name (used in cold call scripts)", value="Your Name").strip() or "Your Name"
+
 # Initialize session state for loaded data and filters if they don't exist
 if 'all_leads_df' not in st.session_state:
     st.session_state.all_leads_df = pd.DataFrame()
@@ -140,6 +161,8 @@ if 'selected_postal_filter' not in st.session_state:
     st.session_state.selected_postal_filter = []
 if 'loaded_postal_prefixes' not in st.session_state:
     st.session_state.loaded_postal_prefixes = []
+if 'data_version' not in st.session_state:
+    st.session_state.data_version = None
 
 
 # --- Load Data Logic ---
@@ -150,17 +173,31 @@ if generate_btn:
         st.error("🚨 Please enter at least one valid postal code prefix.")
         st.stop()
 
-    # Call the cached function to load/classify data
-    all_leads_df = load_and_classify_leads(tuple(sorted(postal_prefixes)), location) # Use tuple for cache key
+    # Serve from the shared territory cache (stale entries refresh in the background)
+    budget_key = None if call_budget >= max_calls else int(call_budget) # Full budget matches warmed territories
+    data_state = None
+    try:
+        with st.spinner("Fetching and classifying businesses in territory..."):
+            all_leads_df, data_version, data_state = cache_warmer.get_or_load(
+                postal_prefixes, location, call_budget=budget_key, progress=st.write, warn=st.warning)
+    except requests.exceptions.RequestException as e:
+        st.error(f"🚨 Network Error during data fetching: {e}. Please check connection and API keys.")
+        all_leads_df = pd.DataFrame()
+    except Exception as e:
+        st.error(f"🚨 Error during data fetching: {e}")
+        all_leads_df = pd.DataFrame()
 
     if not all_leads_df.empty:
         st.session_state.all_leads_df = all_leads_df
         st.session_state.loaded_postal_prefixes = postal_prefixes
+        st.session_state.data_version = data_version
         # Clear previous filters when new data is loaded
         st.session_state.selected_industries_filter = []
         st.session_state.selected_compliance_filter = []
         st.session_state.selected_postal_filter = postal_prefixes # Default to showing all loaded postals
         st.success(f"✅ Loaded and classified {len(st.session_state.all_leads_df)} potential leads in {', '.join(postal_prefixes)}. Use filters below to refine.")
+        if data_state == "stale":
+            st.toast("Showing cached territory data while a fresh copy loads in the background.")
         # Rerun script to immediately show filters and data
         st.rerun()
     else:
@@ -216,7 +253,7 @@ if not st.session_state.all_leads_df.empty:
 
 
     # --- Apply Filters ---
-    df_filtered = df_loaded.copy() # Start with a copy of all loaded data
+    df_filtered = df_loaded # Filters below build new frames; the loaded frame is never modified
 
     if st.session_state.selected_industries_filter: # Check session state directly
         df_filtered = df_filtered[df_filtered['industry'].isin(st.session_state.selected_industries_filter)]
@@ -235,44 +272,23 @@ if not st.session_state.all_leads_df.empty:
     if df_filtered.empty:
         st.warning("No leads match the current filter criteria.")
     else:
-        # Score, Generate Scripts for the filtered data
-        processed_leads_display = []
-        df_display_input = df_filtered.copy() # Work on a copy for processing
-
-        with st.spinner("Scoring leads and generating scripts..."):
-            # Using apply might be cleaner but requires scorer/script_gen adjustments. Loop for now.
-            for index, lead_row in df_display_input.iterrows():
-                 lead_dict = lead_row.to_dict()
-                 try:
-                     # Get zone density for scoring
-                     zone_density = stats_mapper.get_density_score(lead_dict.get("postal_code", ""), lead_dict.get("naics_code", ""))
-                     # Score lead (assuming score_lead returns the updated dict)
-                     # Pass a copy to avoid modifying the original dict within the loop implicitly
-                     scored_lead = scorer.score_lead(lead_dict.copy(), zone_density_score=zone_density)
-                     # Generate script (assuming generate returns the script string)
-                     # Pass a copy of the *scored* lead data
-                     scored_lead["Cold Call Script"] = script_gen.generate(scored_lead.copy())
-                     processed_leads_display.append(scored_lead)
-                 except Exception as e:
-                     st.error(f"Error processing lead {lead_dict.get('business_name')}: {e}")
-                     processed_leads_display.append(lead_dict) # Append original dict on error
-
-
-        if processed_leads_display:
-             df_display = pd.DataFrame(processed_leads_display)
-        else:
-             # If processing failed for all, show the filtered columns but no data
-             df_display = pd.DataFrame(columns=df_filtered.columns)
-
+        # Score, Generate Scripts for the filtered data (memoized by data version + filters + rep)
+        memo_key = ScoredViewCache.make_key(
+            st.session_state.data_version,
+            st.session_state.selected_industries_filter,
+            st.session_state.selected_compliance_filter,
+            st.session_state.selected_postal_filter,
+            rep_name
+        )
+        df_display = scored_view_cache.get_or_compute(memo_key, df_filtered.index, lambda: score_filtered_leads(df_filtered, rep_name))
 
         # Define columns for display, ensuring essential ones exist
         base_cols = ["business_name", "address", "postal_code", "industry", "compliance", "naics_code", "awrv_tier", "score", "Cold Call Script", "Google Maps Link"]
         # Filter base_cols to only those actually present in the final DataFrame
         display_cols = [col for col in base_cols if col in df_display.columns]
 
-        # Ensure 'compliance' column is display-friendly (e.g., comma-separated string)
-        if 'compliance' in df_display.columns:
-             df_display['compliance_display'] = df_display['compliance'].apply(lambda x: ', '.join(x) if isinstance(x, list) else x)
+        # Show 'compliance' as the display-friendly column built during scoring
+        if 'compliance_display' in df_display.columns:
              # Put compliance_display after industry if possible
              if 'industry' in display_cols:
                  idx = display_cols.index('industry')
@@ -284,24 +300,72 @@ if not st.session_state.all_leads_df.empty:
 
         st.dataframe(df_display[display_cols].fillna('N/A'), use_container_width=True) # Fill NA for display
 
-        # --- Download CSV ---
-        csv_data = df_display[display_cols].to_csv(index=False).encode('utf-8')
-        download_filename = f"filtered_leads_{'_'.join(st.session_state.loaded_postal_prefixes)}_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
-        st.download_button(
-            label="📥 Download Filtered Leads (CSV)",
-            data=csv_data,
+        # --- Download (built only on demand, cached by filter state) ---
+        export_key = (
+            st.session_state.data_version,
+            tuple(sorted(st.session_state.selected_industries_filter)),
+            tuple(sorted(st.session_state.selected_compliance_filter)),
+            tuple(sorted(st.session_state.selected_postal_filter)),
+            rep_name, # Scripts include the rep's name
+            tuple(display_cols)
+        )
+        export_col1, export_col2 = st.columns([1, 3])
+        export_format = export_col1.selectbox(
+            "Download format",
+            options=lead_exporter.available_formats(),
+            format_func=lambda fmt: LeadExporter.FORMATS[fmt]["label"],
+            key="export_format"
+        )
+        format_info = LeadExporter.FORMATS[export_format]
+        export_df, export_cols = df_display, list(display_cols)
+
+        def build_export():
+            # Runs only when the rep clicks, on Streamlit's download thread; reruns never touch the file
+            lead_exporter.export(export_df[export_cols], export_format, export_key)
+            # Opened under the exporter's lock so another session's eviction can't delete it first
+            export_file = lead_exporter.open_cached(export_key, export_format)
+            if export_file is None: # Evicted between build and open: rebuild once
+                lead_exporter.export(export_df[export_cols], export_format, export_key)
+                export_file = lead_exporter.open_cached(export_key, export_format)
+            with export_file:
+                return export_file.read()
+
+        download_filename = f"filtered_leads_{'_'.join(st.session_state.loaded_postal_prefixes)}_{datetime.now().strftime('%Y%m%d_%H%M')}.{format_info['ext']}"
+        export_col2.download_button(
+            label=f"📥 Download Filtered Leads ({format_info['label']})",
+            data=build_export, # Deferred: the file is built (or reused from cache) on click
             file_name=download_filename,
-            mime="text/csv",
+            mime=format_info["mime"],
             key="download_csv_button"
         )
 
-        # --- Optional Walk-In Links ---
-        if "Google Maps Link" in df_display.columns and df_display["Google Maps Link"].notna().any():
-             with st.expander("🗺️ View Walk-In Route Links for Filtered Leads"):
-                # Sort by postal code for potentially better routing sequence
-                sorted_links = df_display.sort_values(by='postal_code')[["business_name","Google Maps Link"]].dropna()
-                for index, row in sorted_links.iterrows():
-                    st.markdown(f"[{row['business_name']}]({row['Google Maps Link']})")
+        # --- Optional Walk-In Route ---
+        has_location = pd.Series(False, index=df_display.index)
+        for col in ("latitude", "postal_code"):
+            if col in df_display.columns:
+                has_location |= df_display[col].notna()
+        # Planned only while the toggle is on: an expander body would run on every rerun even when collapsed
+        if has_location.any() and st.toggle("🗺️ Plan Optimized Walk-In Route for Filtered Leads", key="show_walk_in_route"):
+             with st.container(border=True):
+                route_stops = tuple(
+                    tuple(row) for row in df_display.reindex(columns=list(ROUTE_FIELDS)).itertuples(index=False, name=None)
+                )
+                route = plan_walk_in_route(route_stops)
+                st.caption(f"{len(route['stops'])} stops, ~{route['distance_km']:.1f} km straight-line. Open each leg in Google Maps for turn-by-turn directions.")
+                leg_size = WalkInRoutePlanner.MAX_STOPS_PER_MAPS_URL - 1
+                st.markdown("  \n".join(
+                    f"[🧭 Leg {i + 1}: stops {i * leg_size + 1}–{min((i + 1) * leg_size + 1, len(route['stops']))}]({url})"
+                    for i, url in enumerate(route["maps_urls"])
+                ))
+                # One markdown block instead of one element per lead keeps reruns cheap
+                st.markdown("  \n".join(
+                    f"{stop['route_order']}. [{stop['business_name']}]({stop['maps_link']})" if isinstance(stop.get('maps_link'), str)
+                    else f"{stop['route_order']}. {stop['business_name']} (approx. location from postal code)"
+                    for stop in route["stops"]
+                ))
+                if route["unrouted"]:
+                    st.caption(f"{len(route['unrouted'])} leads have no location and are not on the route: "
+                               + ", ".join(str(lead['business_name']) for lead in route["unrouted"]))
 
 else:
     # Initial state before any data is loaded
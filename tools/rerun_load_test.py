@@ -0,0 +1,244 @@
+"""
+Headless rerun-latency load test for the Streamlit app.
+
+Runs app.py under Streamlit's AppTest with GooglePlacesScraper and
+CalgaryRegistryFetcher replaced by synthetic territories, scripts a rep's
+session (load, change filters, switch download format) and reports p50/p95
+rerun latency and peak Python memory per interaction type. Exits with status 1
+if any configured budget is exceeded or the app renders st.error output.
+
+Usage:
+    python tools/rerun_load_test.py --leads 500 --sessions 3 --budget filter=300 --budget download=500 --memory-budget filter=50
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+
+import streamlit as st # noqa: E402
+from streamlit.testing.v1 import AppTest # noqa: E402
+
+# Generic names that no keyword matches, so a share of leads stays "Unknown" like real data
+FILLER_NAMES = ["Holdings", "Trading Co", "Services", "Enterprises", "Group", "Solutions", "& Sons", "Supply"]
+FSAS = ["T1Y", "T2A", "T2B", "T3N"]
+
+def _load_keywords():
+    with open(os.path.join(REPO_ROOT, "data", "naics_keywords.json"), 'r') as f:
+        naics_data = json.load(f)
+    return [kw for details in naics_data.values() for kw in details.get("trigger_keywords", [])]
+
+def _misspell(word, rng):
+    """Drops or swaps one letter so the fuzzy fallback gets exercised."""
+    if len(word) < 5:
+        return word
+    i = rng.randrange(1, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:] if rng.random() < 0.5 else word[:i] + word[i + 1:]
+
+def _postal_code(rng):
+    return f"{rng.choice(FSAS)}{rng.randint(0, 9)}{rng.choice('ABCEGHJKLMNPRSTVXY')}{rng.randint(0, 9)}"
+
+def make_territory(n_google, n_registry, seed=0):
+    """Builds synthetic Google and registry leads in the shape the real fetchers return."""
+    rng = random.Random(seed)
+    keywords = _load_keywords()
+
+    def name():
+        if rng.random() < 0.3:
+            return f"{rng.choice(['Alpine', 'Bow River', 'Prairie', 'Chinook'])} {rng.choice(FILLER_NAMES)}"
+        keyword = rng.choice(keywords)
+        keyword = _misspell(keyword, rng) if rng.random() < 0.2 else keyword
+        return f"{rng.choice(['Calgary', 'Northeast', 'Foothills', 'Apex'])} {keyword.title()} {rng.choice(FILLER_NAMES)}"
+
+    google = []
+    for i in range(n_google):
+        business_name = f"{name()} #{i}"
+        google.append({
+            "business_name": business_name,
+            "address": f"{rng.randint(1, 9999)} {rng.randint(1, 80)} St NE, Calgary, AB {_postal_code(rng)}",
+            "latitude": 51.0447 + rng.uniform(-0.08, 0.08),
+            "longitude": -114.0719 + rng.uniform(-0.12, 0.12),
+            "maps_link": f"https://www.google.com/maps/search/?api=1&query=synthetic+{i}",
+            "source": "Google"
+        })
+    registry = []
+    for i in range(n_registry):
+        registry.append({
+            "business_name": f"{name()} Reg{i}",
+            "address": f"{rng.randint(1, 9999)} {rng.randint(1, 80)} Ave SE",
+            "postal_code": _postal_code(rng),
+            "license_description": "",
+            "source": "Calgary Registry"
+        })
+    return google, registry
+
+def make_stubs(google_leads, registry_leads):
+    """Stand-ins for the two fetchers; no network, no API key, no writes to the yield stats."""
+    class StubGooglePlacesScraper:
+        def __init__(self, api_key=None):
+            pass
+
+        def plan_broad_search(self, location, radius=10000, max_results_per_category=60, planner=None, call_budget=None):
+            return [("synthetic", max_results_per_category // 20)]
+
+        def search_businesses_broadly(self, location, radius=10000, max_results_per_category=60, planner=None, call_budget=None, classifier=None):
+            return [dict(lead) for lead in google_leads]
+
+    class StubCalgaryRegistryFetcher:
+        def __init__(self):
+            pass
+
+        def fetch_by_postal(self, postal_prefixes):
+            return [dict(lead) for lead in registry_leads]
+
+    return StubGooglePlacesScraper, StubCalgaryRegistryFetcher
+
+class RerunRecorder:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.latencies = {}
+        self.peaks = {}
+        self.errors = {} # kind -> st.error elements rendered across its reruns
+        self.error_samples = {} # message -> kind it first appeared in
+
+    def run(self, kind, at, timeout):
+        """Times one rerun (and its peak traced memory) and files it under kind."""
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        at.run(timeout=timeout)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.peaks.setdefault(kind, []).append(peak / 2**20)
+        else:
+            self.latencies.setdefault(kind, []).append(elapsed_ms)
+        if at.exception:
+            raise RuntimeError(f"App raised during '{kind}': {at.exception[0].value}")
+        # A rerun that renders st.error is broken even if it's fast
+        self.errors[kind] = self.errors.get(kind, 0) + len(at.error)
+        for element in at.error:
+            self.error_samples.setdefault(str(element.value), kind)
+
+def run_session(recorder, rng, filter_changes, cold, timeout):
+    """One rep session: open the app, load the territory, flip filters, download."""
+    at = AppTest.from_file(os.path.join(REPO_ROOT, "app.py"), default_timeout=timeout)
+    recorder.run("initial", at, timeout)
+
+    at.sidebar.button[0].click() # Load Businesses in Territory
+    recorder.run("load_cold" if cold else "load", at, timeout)
+
+    industry = at.multiselect(key="selected_industries_filter") if "selected_industries_filter" in _widget_keys(at) else None
+    postal = at.multiselect(key="selected_postal_filter") if "selected_postal_filter" in _widget_keys(at) else None
+    for _ in range(filter_changes):
+        widget = rng.choice([w for w in (industry, postal) if w is not None])
+        options = widget.options
+        pick = rng.sample(options, k=rng.randint(0, min(3, len(options))))
+        widget.set_value(pick)
+        recorder.run("filter", at, timeout)
+        industry = at.multiselect(key="selected_industries_filter") if industry is not None else None
+        postal = at.multiselect(key="selected_postal_filter") if postal is not None else None
+
+    # The export itself is deferred to the download click, which AppTest can't trigger;
+    # this measures what the download block costs every rerun (it should stay near zero)
+    for fmt in at.selectbox(key="export_format").options if "export_format" in _widget_keys(at) else []:
+        at.selectbox(key="export_format").set_value(fmt)
+        recorder.run("download", at, timeout)
+
+def _widget_keys(at):
+    keys = set()
+    for kind in ("multiselect", "selectbox", "button"):
+        for widget in getattr(at, kind):
+            keys.add(widget.key)
+    return keys
+
+def percentile(values, pct):
+    values = sorted(values)
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+def parse_budgets(items):
+    budgets = {}
+    for item in items or []:
+        kind, _, limit = item.partition("=")
+        budgets[kind.strip()] = float(limit)
+    return budgets
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rerun-latency load test for the LeadGen Streamlit app.")
+    parser.add_argument("--leads", type=int, default=500, help="Synthetic Google leads per territory")
+    parser.add_argument("--registry-share", type=float, default=0.3, help="Registry leads as a share of --leads")
+    parser.add_argument("--sessions", type=int, default=3, help="Rep sessions to simulate (the first pays the cold load)")
+    parser.add_argument("--filter-changes", type=int, default=8, help="Filter interactions per session")
+    parser.add_argument("--budget", action="append", metavar="TYPE=MS", help="p95 latency budget per interaction type")
+    parser.add_argument("--memory-budget", action="append", metavar="TYPE=MB", help="Peak traced memory budget per interaction type")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the (slower) tracemalloc pass")
+    parser.add_argument("--timeout", type=float, default=600, help="Per-rerun timeout in seconds")
+    parser.add_argument("--allow-app-errors", action="store_true", help="Report st.error output without failing the run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    google_leads, registry_leads = make_territory(args.leads, int(args.leads * args.registry_share), seed=args.seed)
+    stub_scraper, stub_fetcher = make_stubs(google_leads, registry_leads)
+    os.chdir(REPO_ROOT)
+
+    passes = [RerunRecorder(trace_memory=False)]
+    if not args.no_memory:
+        passes.append(RerunRecorder(trace_memory=True)) # Separate pass so tracing overhead doesn't skew latency
+    with mock.patch("utils.google_scraper.GooglePlacesScraper", stub_scraper), \
+         mock.patch("utils.registry_fetcher.CalgaryRegistryFetcher", stub_fetcher), \
+         mock.patch.dict(os.environ, {"GOOGLE_API_KEY": "load-test"}):
+        for recorder in passes:
+            # Each pass starts cold; otherwise the memory pass would only see the
+            # territory/score/export caches the latency pass already warmed
+            st.cache_resource.clear()
+            st.cache_data.clear()
+            rng = random.Random(args.seed)
+            for session in range(args.sessions):
+                run_session(recorder, rng, args.filter_changes, cold=(session == 0), timeout=args.timeout)
+
+    latencies, peaks = passes[0].latencies, passes[-1].peaks if len(passes) > 1 else {}
+    latency_budgets = parse_budgets(args.budget)
+    memory_budgets = parse_budgets(args.memory_budget)
+
+    print(f"\nSynthetic territory: {len(google_leads)} Google + {len(registry_leads)} registry leads, {args.sessions} sessions")
+    print(f"{'interaction':<12}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'peak MB':>10}{'errors':>8}")
+    failures = []
+    errors = passes[0].errors
+    for kind, values in latencies.items():
+        p50, p95 = percentile(values, 50), percentile(values, 95)
+        peak = max(peaks[kind]) if kind in peaks else None
+        print(f"{kind:<12}{len(values):>6}{p50:>10.1f}{p95:>10.1f}{(f'{peak:.1f}' if peak is not None else '-'):>10}{errors.get(kind, 0):>8}")
+        if kind in latency_budgets and p95 > latency_budgets[kind]:
+            failures.append(f"{kind}: p95 {p95:.1f} ms > budget {latency_budgets[kind]:.0f} ms")
+        if kind in memory_budgets and peak is not None and peak > memory_budgets[kind]:
+            failures.append(f"{kind}: peak {peak:.1f} MB > budget {memory_budgets[kind]:.0f} MB")
+    for kind in set(latency_budgets) | set(memory_budgets):
+        if kind not in latencies:
+            failures.append(f"{kind}: budget set but no '{kind}' interactions ran")
+
+    samples = passes[0].error_samples
+    if samples:
+        print(f"\nApp rendered {sum(errors.values())} st.error elements ({len(samples)} distinct), e.g.:")
+        for message, kind in list(samples.items())[:5]:
+            print(f"  [{kind}] {message}")
+        if not args.allow_app_errors:
+            failures.append(f"app rendered st.error output in {sorted(k for k, n in errors.items() if n)} (use --allow-app-errors to only report it)")
+
+    if failures:
+        print("\nFAILED:\n  " + "\n  ".join(failures))
+        return 1
+    print("\nAll budgets met.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+import time
+import itertools
+from collections import OrderedDict
+
+class TerritoryCache:
+    """
+    Process-wide cache of loaded territory DataFrames with stale-while-revalidate.
+    Entries younger than fresh_ttl are served as-is; older entries (up to max_stale)
+    are still served immediately while a refresh runs in the background.
+    Lives in memory only so lead data never leaves the app process.
+    """
+    def __init__(self, fresh_ttl=3600, max_stale=8 * 3600, max_entries=16):
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries # Ad-hoc territories kept before LRU eviction
+        self.pinned = set() # Configured territories, never evicted by the LRU bound
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._versions = itertools.count(1)
+
+    @staticmethod
+    def normalize_location(location):
+        """Returns "lat,lng" rounded to 4 decimals (the format app.py builds), or None if unparseable."""
+        try:
+            lat, lng = (float(part) for part in str(location).split(","))
+        except (TypeError, ValueError):
+            return None
+        return f"{lat:.4f},{lng:.4f}"
+
+    @classmethod
+    def make_key(cls, postal_prefixes, location, call_budget=None):
+        # Normalized so "51.0447, -114.0719" and "51.0447,-114.0719" share one entry
+        normalized = cls.normalize_location(location)
+        return (tuple(sorted(p.strip().upper() for p in postal_prefixes)), normalized or location, call_budget)
+
+    def get(self, key):
+        """Returns (df, version, state) where state is 'fresh', 'stale' or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None, None
+            age = time.time() - entry["fetched_at"]
+            if age >= self.max_stale:
+                del self._entries[key] # Too old to show a rep
+                return None, None, None
+            self._entries.move_to_end(key)
+        if age < self.fresh_ttl:
+            return entry["df"], entry["version"], "fresh"
+        return entry["df"], entry["version"], "stale"
+
+    def put(self, key, df):
+        """Stores a freshly loaded frame and returns its data version."""
+        with self._lock:
+            version = next(self._versions)
+            now = time.time()
+            self._entries[key] = {"df": df, "fetched_at": now, "version": version}
+            self._entries.move_to_end(key)
+            # Drop expired entries, then least recently used ad-hoc territories over the bound
+            for old_key in [k for k, e in self._entries.items() if now - e["fetched_at"] >= self.max_stale]:
+                del self._entries[old_key]
+            ad_hoc = [k for k in self._entries if k not in self.pinned]
+            for old_key in ad_hoc[:max(0, len(ad_hoc) - self.max_entries)]:
+                del self._entries[old_key]
+        return version
+
+    def age(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        return time.time() - entry["fetched_at"] if entry else None
+
+class CacheWarmer:
+    """
+    Keeps configured territories warm in a TerritoryCache from a daemon thread
+    and refreshes stale entries on demand without blocking the caller.
+    """
+    def __init__(self, loader, cache, territories_path="data/warm_territories.json", interval=1800):
+        self.loader = loader
+        self.cache = cache
+        self.interval = interval # Seconds between scheduled warm passes
+        # Construct the absolute path relative to this file's directory
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.territories_path = os.path.join(base_dir, '..', territories_path) # Go up one level from utils/
+        self.territories = self._load_territories()
+        self.cache.pinned.update(self.territories)
+        self._refreshing = set()
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _load_territories(self):
+        try:
+            with open(self.territories_path, 'r') as f:
+                territories = json.load(f)
+        except FileNotFoundError:
+            return []
+        except json.JSONDecodeError:
+            print(f"Error: Could not decode JSON from {self.territories_path}")
+            return []
+        keys = []
+        for t in territories:
+            location = self.cache.normalize_location(t.get("location"))
+            if not t.get("postal_prefixes") or location is None:
+                print(f"Warning: Skipping warm territory {t!r} in {self.territories_path}; "
+                      "it needs postal_prefixes and a \"lat,lng\" location.")
+                continue
+            if location != t["location"]:
+                print(f"Cache warmer: warm territory location {t['location']!r} normalized to {location!r}. "
+                      "Sessions only share it when they pick the same coordinates to 4 decimals.")
+            keys.append(self.cache.make_key(t["postal_prefixes"], location, t.get("call_budget")))
+        return keys
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _refresh(self, key):
+        """Loads a territory and stores it. Errors keep the previous (stale) entry."""
+        postal_prefixes, location, call_budget = key
+        try:
+            with self._key_lock(key):
+                df = self.loader.load(postal_prefixes, location, call_budget=call_budget)
+            if df.empty:
+                print(f"Cache warmer: no leads for {postal_prefixes}, keeping previous entry.")
+                return
+            version = self.cache.put(key, df)
+            print(f"Cache warmer: refreshed {postal_prefixes} @ {location} (version {version}, {len(df)} leads)")
+        except Exception as e:
+            print(f"Cache warmer: refresh failed for {postal_prefixes} @ {location}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def refresh_async(self, key):
+        """Starts a background refresh unless one is already running. Returns True if started."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key,), name="territory-refresh", daemon=True).start()
+        return True
+
+    def is_refreshing(self, key):
+        with self._lock:
+            return key in self._refreshing
+
+    def get_or_load(self, postal_prefixes, location, call_budget=None, progress=print, warn=print):
+        """
+        Returns (df, version, state). Fresh and stale hits return immediately
+        (stale ones kick off a background refresh); misses load synchronously.
+        """
+        key = self.cache.make_key(postal_prefixes, location, call_budget)
+        df, version, state = self.cache.get(key)
+        if state == "stale":
+            self.refresh_async(key)
+        if state is not None:
+            return df, version, state
+
+        # Only one session pays for a cold load; others wait and then hit the cache
+        with self._key_lock(key):
+            df, version, state = self.cache.get(key)
+            if state is not None:
+                return df, version, state
+            print(f"CACHE MISS: Loading data for postal prefixes: {key[0]}, location: {location}") # Log cache miss
+            df = self.loader.load(key[0], location, call_budget=call_budget, progress=progress, warn=warn)
+            if df.empty:
+                return df, None, None
+            return df, self.cache.put(key, df), "loaded"
+
+    def warm_once(self):
+        """Refreshes every configured territory that isn't fresh or is due for its scheduled refresh."""
+        for key in self.territories:
+            age = self.cache.age(key)
+            if age is None or age >= self.interval:
+                with self._lock:
+                    if key in self._refreshing:
+                        continue
+                    self._refreshing.add(key)
+                self._refresh(key)
+
+    def _run(self):
+        while True:
+            self.warm_once()
+            time.sleep(self.interval)
+
+    def start(self):
+        """Starts the scheduled warm loop (no-op if there are no territories or it's already running)."""
+        if not self.territories or (self._thread and self._thread.is_alive()):
+            return
+        print(f"Cache warmer: warming {len(self.territories)} territories every {self.interval}s")
+        self._thread = threading.Thread(target=self._run, name="territory-cache-warmer", daemon=True)
+        self._thread.start()
+
+# Example usage:
+# cache = TerritoryCache()
+# warmer = CacheWarmer(TerritoryLoader(...), cache)
+# warmer.start()
+# df, version, state = warmer.get_or_load(["T1Y", "T2A"], "51.0447,-114.0719")
@@ -24,23 +24,40 @@ class GooglePlacesScraper:
             print(f"Error during Google Places API request: {e}")
             return None # Return None on error
 
-    def search_businesses_broadly(self, location, radius=10000, max_results_per_category=60):
+    def plan_broad_search(self, location, radius=10000, max_results_per_category=60, planner=None, call_budget=None):
+        """
+        Returns the ordered list of (category, max_pages) a broad search will run.
+        Without a planner every category gets the same page allowance, in the default order.
+        """
+        broad_categories = self.naics_map.get_broad_search_categories()
+        max_pages = max_results_per_category // 20 # Google returns up to 20 per page
+        if planner is None:
+            return [(category, max_pages) for category in broad_categories]
+        area = planner.area_key(location, radius)
+        return planner.plan(area, broad_categories, call_budget=call_budget, max_pages_per_category=max_pages)
+
+    def search_businesses_broadly(self, location, radius=10000, max_results_per_category=60, planner=None, call_budget=None, classifier=None):
         """
         Searches for businesses using broad categories within a location.
         Handles pagination up to a limit (to control API usage).
+        If a PlacesQuotaPlanner is given, categories are ordered/truncated to fit call_budget
+        and the yield of every call is recorded for future plans. Pass the app's NAICSKeywordMap
+        as classifier so the recorded hit rate uses the same matcher as the real classification.
         Returns a deduplicated list of basic business info.
         """
-        broad_categories = self.naics_map.get_broad_search_categories()
+        search_plan = self.plan_broad_search(location, radius, max_results_per_category, planner, call_budget)
+        area = planner.area_key(location, radius) if planner else None
+        classifier = classifier or self.naics_map
         all_results = []
         seen_place_ids = set()
-        max_pages = max_results_per_category // 20 # Google returns up to 20 per page
 
-        print(f"Starting broad Google scrape for categories: {', '.join(broad_categories)}") # Log start
+        print(f"Starting broad Google scrape for categories: {', '.join(f'{c} (x{p})' for c, p in search_plan)}") # Log start
 
-        for category in broad_categories:
+        for category, max_pages in search_plan:
             print(f"  Scraping category: {category}...")
             page_count = 0
             next_page_token = None
+            data = None
 
             while page_count < max_pages:
                 params = {
@@ -65,16 +82,22 @@ class GooglePlacesScraper:
                      # Consider breaking or continuing based on the error type
                      if data.get("status") == "OVER_QUERY_LIMIT":
                          print("    Hit query limit. Stopping Google scrape.")
+                         if planner: planner.save()
                          return all_results # Stop all scraping if limit is hit
                      break # Stop this category otherwise
 
 
+                new_unique = 0
+                relevant = 0
                 for place in data.get("results", []):
                     place_id = place.get("place_id")
                     if place_id and place_id not in seen_place_ids:
                         seen_place_ids.add(place_id)
                         name = place.get("name")
                         address = place.get("formatted_address")
+                        new_unique += 1
+                        if planner and classifier.guess_naics_from_text(f"{name} {address}", name=name or '')[0]:
+                            relevant += 1 # Counts towards the category's classification hit rate
                         lat = place.get("geometry", {}).get("location", {}).get("lat")
                         lng = place.get("geometry", {}).get("location", {}).get("lng")
                         # Use place_id for a more stable Maps link if available
@@ -94,14 +117,18 @@ class GooglePlacesScraper:
                             "source": "Google" # Add source marker
                         })
 
+                if planner:
+                    planner.record_call(area, category, page_count, new_unique, relevant)
                 page_count += 1
                 next_page_token = data.get("next_page_token")
 
                 if not next_page_token:
                     break # No more pages for this category
 
-            print(f"    Finished category '{category}'. Found {len(data.get('results',[]))} results on last page. Total unique results so far: {len(all_results)}")
+            print(f"    Finished category '{category}'. Found {len((data or {}).get('results',[]))} results on last page. Total unique results so far: {len(all_results)}")
 
+        if planner:
+            planner.save()
         print(f"Finished broad Google scrape. Total unique results found: {len(all_results)}")
         return all_results
 
@@ -0,0 +1,124 @@
+import atexit
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # Parquet export is optional
+    pa = None
+    pq = None
+
+class LeadExporter:
+    """
+    Builds download files on demand by streaming rows in chunks to a temp file,
+    so widget reruns never pay serialization cost and memory stays flat.
+    Finished files are cached by (filter state, format) and evicted LRU.
+    """
+    FORMATS = {
+        "csv": {"label": "CSV", "ext": "csv", "mime": "text/csv"},
+        "csv.gz": {"label": "CSV (gzip)", "ext": "csv.gz", "mime": "application/gzip"},
+        "parquet": {"label": "Parquet", "ext": "parquet", "mime": "application/vnd.apache.parquet"},
+    }
+
+    def __init__(self, chunk_size=5000, max_artifacts=16):
+        self.chunk_size = chunk_size
+        self.max_artifacts = max_artifacts
+        self.export_dir = tempfile.mkdtemp(prefix="leadgen_exports_")
+        self._artifacts = OrderedDict() # (cache_key, fmt) -> file path
+        self._lock = threading.Lock()
+        atexit.register(shutil.rmtree, self.export_dir, ignore_errors=True) # Exports never outlive the process
+
+    def available_formats(self):
+        return [fmt for fmt in self.FORMATS if fmt != "parquet" or pq is not None]
+
+    def get_cached(self, cache_key, fmt):
+        """Returns the path of an already built export, or None."""
+        with self._lock:
+            path = self._artifacts.get((cache_key, fmt))
+            if path is not None:
+                self._artifacts.move_to_end((cache_key, fmt))
+            return path
+
+    def open_cached(self, cache_key, fmt):
+        """
+        Opens an already built export for reading, or returns None.
+        The file is opened under the lock so LRU eviction can't delete it between
+        lookup and open; an open handle stays readable after eviction.
+        """
+        with self._lock:
+            path = self._artifacts.get((cache_key, fmt))
+            if path is None:
+                return None
+            try:
+                handle = open(path, 'rb')
+            except FileNotFoundError:
+                del self._artifacts[(cache_key, fmt)]
+                return None
+            self._artifacts.move_to_end((cache_key, fmt))
+            return handle
+
+    def export(self, df, fmt, cache_key):
+        """Writes df in the requested format (or reuses a cached file) and returns its path."""
+        if fmt not in self.available_formats():
+            raise ValueError(f"Unsupported export format: {fmt}")
+        cached = self.get_cached(cache_key, fmt)
+        if cached is not None:
+            return cached
+
+        fd, path = tempfile.mkstemp(suffix=f".{self.FORMATS[fmt]['ext']}", dir=self.export_dir)
+        os.close(fd)
+        try:
+            if fmt == "parquet":
+                self._write_parquet(df, path)
+            else:
+                self._write_csv(df, path, compress=(fmt == "csv.gz"))
+        except Exception:
+            os.remove(path)
+            raise
+
+        with self._lock:
+            self._artifacts[(cache_key, fmt)] = path
+            while len(self._artifacts) > self.max_artifacts:
+                _, old_path = self._artifacts.popitem(last=False)
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+        return path
+
+    def _chunks(self, df):
+        for start in range(0, len(df), self.chunk_size):
+            yield df.iloc[start:start + self.chunk_size]
+
+    def _write_csv(self, df, path, compress=False):
+        opener = gzip.open(path, 'wt', encoding='utf-8', newline='') if compress else open(path, 'w', encoding='utf-8', newline='')
+        with opener as f:
+            if df.empty:
+                df.to_csv(f, index=False) # Header only
+                return
+            for i, chunk in enumerate(self._chunks(df)):
+                chunk.to_csv(f, index=False, header=(i == 0))
+
+    def _write_parquet(self, df, path):
+        # Object columns are written as strings so every chunk shares one schema
+        object_cols = [col for col in df.columns if df[col].dtype == object]
+        writer = None
+        try:
+            for chunk in self._chunks(df) if not df.empty else [df]:
+                chunk = chunk.astype({col: "string" for col in object_cols})
+                if writer is None:
+                    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                    writer = pq.ParquetWriter(path, schema)
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        finally:
+            if writer is not None:
+                writer.close()
+
+# Example usage:
+# exporter = LeadExporter()
+# path = exporter.export(df, "csv.gz", cache_key=("T1Y", "HACCP"))
@@ -1,10 +1,19 @@
 import json
 import os
 import re # For parsing display options
+import time
+from collections import Counter
 from fuzzywuzzy import process, fuzz # You might need to install python-Levenshtein for speed
 
 class NAICSKeywordMap:
-    def __init__(self, json_path="data/naics_keywords.json"):
+    def __init__(self, json_path="data/naics_keywords.json", fuzzy_fallback=False, fuzzy_threshold=85,
+                 fuzzy_time_budget_ms=2.0, fuzzy_max_candidates=8):
+        # Fuzzy fallback only runs when the exact matcher finds nothing (off by default for backward compatibility)
+        self.fuzzy_fallback = fuzzy_fallback
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_time_budget_ms = fuzzy_time_budget_ms # Per-row budget; rows over it are counted in fuzzy_stats
+        self.fuzzy_max_candidates = fuzzy_max_candidates # Fixed, so results never depend on CPU load
+        self.fuzzy_stats = {"rows": 0, "matched": 0, "total_ms": 0.0, "over_budget": 0}
         # Construct the absolute path relative to this file's directory
         base_dir = os.path.dirname(os.path.abspath(__file__))
         absolute_json_path = os.path.join(base_dir, '..', json_path) # Go up one level from utils/
@@ -20,12 +29,16 @@ class NAICSKeywordMap:
             self.keyword_to_naics = {}
             self.display_options = []
             self.display_option_to_details = {}
+            self.fuzzy_keyword_to_naics = {}
+            self.trigram_index = {}
         except json.JSONDecodeError:
             print(f"Error: Could not decode JSON from {absolute_json_path}")
             self.naics_data = {}
             self.keyword_to_naics = {}
             self.display_options = []
             self.display_option_to_details = {}
+            self.fuzzy_keyword_to_naics = {}
+            self.trigram_index = {}
 
     def _build_mappings(self):
         self.keyword_to_naics = {}
@@ -47,6 +60,83 @@ class NAICSKeywordMap:
                 # Store the most relevant NAICS code for each keyword (can be refined)
                 if keyword.lower() not in self.keyword_to_naics:
                     self.keyword_to_naics[keyword.lower()] = naics_code
+        self._build_trigram_index()
+
+    @staticmethod
+    def _trigrams(text):
+        """Character trigrams of the normalized text, with word boundaries padded by spaces."""
+        normalized = " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+        padded = f"  {normalized} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def _build_trigram_index(self):
+        """Precomputes trigram -> keywords over every trigger keyword for the fuzzy fallback."""
+        self.fuzzy_keyword_to_naics = {}
+        self.trigram_index = {}
+        self._keyword_trigram_counts = {}
+        for naics_code, details in self.naics_data.items():
+            for keyword in details.get("trigger_keywords", []) + details.get("keywords", []):
+                keyword_lower = keyword.lower()
+                if keyword_lower in self.fuzzy_keyword_to_naics:
+                    continue
+                self.fuzzy_keyword_to_naics[keyword_lower] = naics_code
+                grams = self._trigrams(keyword_lower)
+                self._keyword_trigram_counts[keyword_lower] = len(grams)
+                for gram in grams:
+                    self.trigram_index.setdefault(gram, set()).add(keyword_lower)
+
+    def _fuzzy_candidates(self, text, min_overlap=0.3):
+        """Keywords sharing at least min_overlap of their trigrams with the text, best first."""
+        shared = Counter()
+        for gram in self._trigrams(text):
+            for keyword in self.trigram_index.get(gram, ()):
+                shared[keyword] += 1
+        ranked = sorted(
+            ((count / self._keyword_trigram_counts[kw], kw) for kw, count in shared.items()),
+            reverse=True
+        )
+        return [kw for overlap, kw in ranked[:self.fuzzy_max_candidates] if overlap >= min_overlap]
+
+    @staticmethod
+    def _window_ratio(words, keyword):
+        """Best fuzz.ratio between the keyword and any run of as many words from the text."""
+        size = len(keyword.split())
+        if len(words) <= size:
+            return fuzz.ratio(" ".join(words), keyword)
+        return max(fuzz.ratio(" ".join(words[i:i + size]), keyword) for i in range(len(words) - size + 1))
+
+    def fuzzy_match_keyword(self, text, threshold=None, partial=True):
+        """
+        Fuzzy fallback: prefilters keywords by trigram overlap, then scores only those
+        candidates with the Levenshtein-backed fuzz.ratio.
+        With partial=True (free text such as business names) each keyword is compared to
+        word windows of its own length, so "Electrican" matches but a keyword's prefix
+        ("Electric Avenue", "Contra Costa") doesn't. Use partial=False for a single keyword.
+        Returns (keyword, score) or (None, 0).
+        """
+        if not text or not self.trigram_index:
+            return None, 0
+        threshold = self.fuzzy_threshold if threshold is None else threshold
+        start = time.perf_counter()
+        best = None
+        candidates = self._fuzzy_candidates(text)
+        if candidates and partial:
+            words = re.sub(r"[^a-z0-9]+", " ", text.lower()).split()
+            scored = max((self._window_ratio(words, kw), kw) for kw in candidates)
+            best = (scored[1], scored[0]) if scored[0] >= threshold else None
+        elif candidates:
+            best = process.extractOne(text.lower(), candidates, scorer=fuzz.ratio, score_cutoff=threshold)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        # Measure every row so slow classification shows up in fuzzy_stats
+        self.fuzzy_stats["rows"] += 1
+        self.fuzzy_stats["total_ms"] += elapsed_ms
+        if elapsed_ms > self.fuzzy_time_budget_ms:
+            self.fuzzy_stats["over_budget"] += 1
+        if best:
+            self.fuzzy_stats["matched"] += 1
+            return best[0], best[1]
+        return None, 0
 
     def get_keywords_for_naics(self, naics_code):
         return self.naics_data.get(str(naics_code), {}).get("trigger_keywords", [])
@@ -63,15 +153,16 @@ class NAICSKeywordMap:
 
     def get_naics_from_keyword(self, keyword):
         """Finds the best matching NAICS code for a given keyword."""
-        if not self.keyword_to_naics: return None
+        if not self.keyword_to_naics and not self.fuzzy_fallback: return None
         # Simple exact match first
         match = self.keyword_to_naics.get(keyword.lower())
         if match:
             return match
-        # Add fuzzy matching if exact fails (optional, can be slow)
-        # best_match, score = process.extractOne(keyword.lower(), self.keyword_to_naics.keys())
-        # if score > 80: # Adjust threshold as needed
-        #     return self.keyword_to_naics[best_match]
+        # Trigram-prefiltered fuzzy matching if exact fails
+        if self.fuzzy_fallback:
+            best_match, score = self.fuzzy_match_keyword(keyword, partial=False)
+            if best_match:
+                return self.fuzzy_keyword_to_naics[best_match]
         return None
 
     def get_details_from_naics(self, naics_code):
@@ -86,10 +177,14 @@ class NAICSKeywordMap:
         """Retrieves the details dictionary based on the selected display option string."""
         return self.display_option_to_details.get(display_option)
 
-    def guess_naics_from_text(self, text, threshold=80):
+    def guess_naics_from_text(self, text, threshold=None, fuzzy=None, name=None):
         """
         Attempts to guess the most relevant NAICS code and industry name
         based on keywords found within the input text (e.g., business name, description).
+        If nothing matches exactly and fuzzy matching is on (fuzzy=None uses the instance
+        setting), falls back to fuzzy_match_keyword with `threshold` as the minimum score
+        (threshold=None uses the instance's fuzzy_threshold). Pass the business `name` so the
+        fallback scores only the name; addresses ("Electric Ave") cause false matches.
         Returns a tuple: (best_naics_code, best_industry_name, associated_compliance_tags) or (None, None, [])
         """
         if not text or not self.naics_data:
@@ -118,6 +213,12 @@ class NAICSKeywordMap:
                         best_match_naics = naics_code
                         matched_keyword = keyword_lower
 
+        # Fuzzy fallback only for text the exact matcher left unclassified (misspelled/inflected names)
+        if not best_match_naics and (self.fuzzy_fallback if fuzzy is None else fuzzy):
+            matched_keyword, highest_score = self.fuzzy_match_keyword(name if name is not None else text_lower, threshold=threshold)
+            if matched_keyword:
+                best_match_naics = self.fuzzy_keyword_to_naics[matched_keyword]
+
         if best_match_naics:
             details = self.naics_data.get(best_match_naics, {})
             industry = details.get("industry", "Unknown Industry")
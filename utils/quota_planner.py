@@ -0,0 +1,159 @@
+import json
+import os
+import heapq
+import tempfile
+import threading
+
+class PlacesQuotaPlanner:
+    """
+    Plans Google Places Text Search calls for a broad territory load.
+    Keeps historical yield per (area, category, page) so categories that mostly
+    return duplicates of earlier categories stop eating the call budget.
+    """
+    # Legacy Places Text Search list price, USD per request (adjust if billing changes)
+    COST_PER_CALL_USD = 0.032
+    RESULTS_PER_PAGE = 20 # Google returns up to 20 per page
+    PAGE_DECAY = 0.5 # Page N+1 is assumed to yield this share of page N until it has history of its own
+
+    def __init__(self, stats_path="data/places_yield_stats.json", prior_new_per_call=10.0,
+                 prior_hit_rate=0.5, prior_weight=1.0, min_new_per_call=1.0):
+        # Construct the absolute path relative to this file's directory
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.stats_path = os.path.join(base_dir, '..', stats_path) # Go up one level from utils/
+        # Optimistic priors so categories with no history still get explored
+        self.prior_new_per_call = prior_new_per_call
+        self.prior_hit_rate = prior_hit_rate
+        self.prior_weight = prior_weight
+        # Calls expected to return fewer new place_ids than this are truncated
+        self.min_new_per_call = min_new_per_call
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock() # Serializes writers so concurrent loads can't interleave a save
+        self.stats = self._load_stats()
+
+    def _load_stats(self):
+        try:
+            with open(self.stats_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            print(f"Warning: Could not decode yield stats from {self.stats_path}. Starting fresh.")
+            return {}
+
+    def save(self):
+        """Persists yield stats. Only aggregate counts are stored, never lead data."""
+        with self._save_lock:
+            with self._lock:
+                snapshot = json.dumps(self.stats, indent=2, sort_keys=True)
+            tmp_path = None
+            try:
+                # Unique temp file in the same directory, then an atomic swap so a crash never leaves half a file
+                fd, tmp_path = tempfile.mkstemp(prefix=".places_yield_stats.", suffix=".tmp", dir=os.path.dirname(self.stats_path))
+                with os.fdopen(fd, 'w') as f:
+                    f.write(snapshot)
+                os.replace(tmp_path, self.stats_path)
+            except OSError as e:
+                print(f"Warning: Could not save yield stats to {self.stats_path}: {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    @staticmethod
+    def area_key(location, radius):
+        """Areas are keyed by search center (rounded to ~1km) and radius."""
+        try:
+            lat, lng = (float(part) for part in str(location).split(','))
+            return f"{lat:.2f},{lng:.2f}@{int(radius)}"
+        except ValueError:
+            return f"{location}@{radius}"
+
+    def record_call(self, area, category, page_index, new_unique, relevant):
+        """Records the outcome of one Text Search call (one page of one category)."""
+        with self._lock:
+            page = (self.stats.setdefault(area, {})
+                              .setdefault(category, {})
+                              .setdefault(str(page_index), {"calls": 0, "new_unique": 0, "relevant": 0}))
+            page["calls"] += 1
+            page["new_unique"] += new_unique
+            page["relevant"] += relevant
+
+    def expected_yield(self, area, category, page_index):
+        """
+        Returns (expected new unique leads, expected relevant leads) for one call.
+        Each page is smoothed towards a prior whose weight shrinks as that page's own
+        history grows, so repeated poor calls sink it instead of being outvoted by the prior.
+        Page N+1's prior is page N's smoothed yield, so a dead page 0 drags later pages down with it.
+        """
+        with self._lock:
+            history = self.stats.get(area, {}).get(category, {})
+            pages = [dict(history.get(str(i), {})) for i in range(page_index + 1)]
+
+        prior_new = self.prior_new_per_call
+        prior_hit_rate = self.prior_hit_rate
+        for page in pages:
+            calls = page.get("calls", 0)
+            new_unique = page.get("new_unique", 0)
+            relevant = page.get("relevant", 0)
+            w = self.prior_weight / (1 + calls)
+            exp_new = (new_unique + prior_new * w) / (calls + w)
+            hit_rate = (relevant + prior_hit_rate * w) / (new_unique + w)
+            # Later pages naturally yield less than the page before them
+            prior_new = exp_new * self.PAGE_DECAY
+            prior_hit_rate = hit_rate
+        return exp_new, exp_new * hit_rate
+
+    def plan(self, area, categories, call_budget=None, max_pages_per_category=3):
+        """
+        Returns an ordered list of (category, pages) to scrape within call_budget.
+        Calls are picked greedily by expected relevant leads (ties broken by new leads),
+        and a category's page N is only picked once page N-1 is in the plan.
+        """
+        if call_budget is None:
+            call_budget = len(categories) * max_pages_per_category
+
+        heap = []
+        for order, category in enumerate(categories):
+            exp_new, exp_relevant = self.expected_yield(area, category, 0)
+            heapq.heappush(heap, (-exp_relevant, -exp_new, order, category, 0))
+
+        pages = {}
+        first_pick = {}
+        calls = 0
+        while heap and calls < call_budget:
+            neg_rel, neg_new, order, category, page_index = heapq.heappop(heap)
+            if -neg_new < self.min_new_per_call:
+                continue # Mostly duplicates historically, not worth the call
+            pages[category] = page_index + 1
+            first_pick.setdefault(category, calls)
+            calls += 1
+            if page_index + 1 < max_pages_per_category:
+                exp_new, exp_relevant = self.expected_yield(area, category, page_index + 1)
+                heapq.heappush(heap, (-exp_relevant, -exp_new, order, category, page_index + 1))
+
+        # Best categories first so their place_ids win dedup and a hard quota stop hurts least
+        ordered = sorted(pages, key=lambda c: first_pick[c])
+        return [(category, pages[category]) for category in ordered]
+
+    def forecast(self, area, plan):
+        """Summarizes the cost and expected yield of a plan for display before a load starts."""
+        calls = 0
+        exp_new = 0.0
+        exp_relevant = 0.0
+        for category, pages in plan:
+            for page_index in range(pages):
+                new_unique, relevant = self.expected_yield(area, category, page_index)
+                calls += 1
+                exp_new += new_unique
+                exp_relevant += relevant
+        return {
+            "calls": calls,
+            "estimated_cost_usd": round(calls * self.COST_PER_CALL_USD, 2),
+            "expected_new_leads": round(exp_new),
+            "expected_relevant_leads": round(exp_relevant),
+            "has_history": area in self.stats
+        }
+
+# Example usage:
+# planner = PlacesQuotaPlanner()
+# area = planner.area_key("51.0447,-114.0719", 10000)
+# plan = planner.plan(area, ["restaurant", "hotel"], call_budget=4)
+# print(plan, planner.forecast(area, plan))
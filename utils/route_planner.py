@@ -0,0 +1,314 @@
+import heapq
+import math
+import time
+from urllib.parse import urlencode
+
+class _KDTree:
+    """
+    Median-split k-d tree over projected (km) coordinates for nearest-neighbour lookups.
+    Splits on the point order, not the bounding box, so tightly clustered stops still
+    get a balanced tree. Points can be removed (for the greedy seed); subtrees with no
+    points left are skipped.
+    """
+    LEAF_SIZE = 8
+
+    def __init__(self, xs, ys):
+        self.xs = xs
+        self.ys = ys
+        self.perm = list(range(len(xs)))
+        self.lo, self.hi, self.left, self.right, self.parent, self.box, self.alive = [], [], [], [], [], [], []
+        self.leaf_of = [0] * len(xs)
+        self.removed = [False] * len(xs)
+        if xs:
+            self._build(0, len(xs), -1)
+
+    def _build(self, lo, hi, parent):
+        members = self.perm[lo:hi]
+        px = [self.xs[i] for i in members]
+        py = [self.ys[i] for i in members]
+        node = len(self.lo)
+        self.lo.append(lo)
+        self.hi.append(hi)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.parent.append(parent)
+        self.box.append((min(px), max(px), min(py), max(py)))
+        self.alive.append(hi - lo)
+        if hi - lo <= self.LEAF_SIZE:
+            for i in members:
+                self.leaf_of[i] = node
+            return node
+        # Split the wider side at the median point
+        coords = self.xs if max(px) - min(px) >= max(py) - min(py) else self.ys
+        self.perm[lo:hi] = sorted(members, key=coords.__getitem__)
+        mid = (lo + hi) // 2
+        self.left[node] = self._build(lo, mid, node)
+        self.right[node] = self._build(mid, hi, node)
+        return node
+
+    def remove(self, i):
+        if self.removed[i]:
+            return
+        self.removed[i] = True
+        node = self.leaf_of[i]
+        while node >= 0:
+            self.alive[node] -= 1
+            node = self.parent[node]
+
+    def _box_dist2(self, node, x, y):
+        min_x, max_x, min_y, max_y = self.box[node]
+        dx = min_x - x if x < min_x else (x - max_x if x > max_x else 0.0)
+        dy = min_y - y if y < min_y else (y - max_y if y > max_y else 0.0)
+        return dx * dx + dy * dy
+
+    def nearest(self, x, y, k=1, exclude=None):
+        """Returns up to k (distance, index) pairs of remaining points closest to (x, y), nearest first."""
+        xs, ys = self.xs, self.ys
+        best = [] # Max-heap of (-squared distance, index)
+        queue = [(0.0, 0)] if self.alive and self.alive[0] else []
+        while queue:
+            box_d2, node = heapq.heappop(queue)
+            if len(best) == k and box_d2 > -best[0][0]:
+                break # Every remaining box is farther than the current k-th neighbour
+            left = self.left[node]
+            if left < 0:
+                for p in range(self.lo[node], self.hi[node]):
+                    i = self.perm[p]
+                    if i == exclude or self.removed[i]:
+                        continue
+                    d2 = (xs[i] - x) ** 2 + (ys[i] - y) ** 2
+                    if len(best) < k:
+                        heapq.heappush(best, (-d2, i))
+                    elif d2 < -best[0][0]:
+                        heapq.heapreplace(best, (-d2, i))
+                continue
+            for child in (left, self.right[node]):
+                if self.alive[child]:
+                    child_d2 = self._box_dist2(child, x, y)
+                    if len(best) < k or child_d2 < -best[0][0]:
+                        heapq.heappush(queue, (child_d2, child))
+        return sorted((math.sqrt(-d2), i) for d2, i in best)
+
+class WalkInRoutePlanner:
+    """
+    Orders filtered leads into a short walk-in/drive route.
+    Uses Google coordinates where present and falls back to the centroid of other
+    leads sharing the postal code (then FSA) for registry-only leads.
+    Nearest-neighbour seed on a k-d tree, then 2-opt and Or-opt moves restricted
+    to each stop's nearest neighbours until no move helps or the time cap is hit.
+    """
+    KM_PER_DEG_LAT = 110.57
+    KM_PER_DEG_LNG_EQUATOR = 111.32
+    MAX_STOPS_PER_MAPS_URL = 10 # Origin + 8 waypoints + destination fits Google Maps URL limits
+
+    def __init__(self, time_cap=0.5, neighbours=8, travel_mode="driving"):
+        self.time_cap = time_cap # Seconds spent improving the seed route (index and seed aren't counted)
+        self.neighbours = neighbours
+        self.travel_mode = travel_mode
+
+    @staticmethod
+    def _valid_coord(lat, lng):
+        try:
+            lat, lng = float(lat), float(lng)
+        except (TypeError, ValueError):
+            return None
+        if math.isnan(lat) or math.isnan(lng):
+            return None
+        return lat, lng
+
+    @staticmethod
+    def _postal_keys(postal_code):
+        if not isinstance(postal_code, str):
+            return []
+        code = postal_code.replace(" ", "").upper()
+        return [k for k in (code, code[:3]) if len(k) >= 3]
+
+    def resolve_coordinates(self, leads):
+        """
+        Returns (located, unrouted): located is a list of (lead, lat, lng, coord_source)
+        with coord_source 'google' or 'postal_centroid'.
+        """
+        sums = {}
+        for lead in leads:
+            coord = self._valid_coord(lead.get("latitude"), lead.get("longitude"))
+            if coord:
+                for key in self._postal_keys(lead.get("postal_code")):
+                    s = sums.setdefault(key, [0.0, 0.0, 0])
+                    s[0] += coord[0]
+                    s[1] += coord[1]
+                    s[2] += 1
+
+        located, unrouted = [], []
+        for lead in leads:
+            coord = self._valid_coord(lead.get("latitude"), lead.get("longitude"))
+            if coord:
+                located.append((lead, coord[0], coord[1], "google"))
+                continue
+            for key in self._postal_keys(lead.get("postal_code")):
+                if key in sums:
+                    lat_sum, lng_sum, n = sums[key]
+                    located.append((lead, lat_sum / n, lng_sum / n, "postal_centroid"))
+                    break
+            else:
+                unrouted.append(lead)
+        return located, unrouted
+
+    def plan(self, leads, start=None):
+        """
+        Plans a route through leads (list of dicts). start is an optional (lat, lng).
+        Returns a dict with ordered 'stops' (lead dicts plus route_order/lat/lng/coord_source),
+        'unrouted' leads without any location, 'distance_km' and multi-stop 'maps_urls'.
+        """
+        located, unrouted = self.resolve_coordinates(leads)
+        if not located:
+            return {"stops": [], "unrouted": unrouted, "distance_km": 0.0, "maps_urls": []}
+
+        # Stops sharing a point (same building, or every registry-only lead on one postal centroid)
+        # are routed as one point and expanded afterwards, so the index never sees duplicates
+        groups = {}
+        for idx, (_, lat, lng, _) in enumerate(located):
+            groups.setdefault((lat, lng), []).append(idx)
+        points = list(groups)
+
+        lat0 = sum(lat for lat, _ in points) / len(points)
+        kx = self.KM_PER_DEG_LNG_EQUATOR * math.cos(math.radians(lat0))
+        xs = [lng * kx for _, lng in points]
+        ys = [lat * self.KM_PER_DEG_LAT for lat, _ in points]
+
+        order = self._solve(xs, ys, start=(start[1] * kx, start[0] * self.KM_PER_DEG_LAT) if start else None)
+
+        stops = []
+        for i in order:
+            for idx in groups[points[i]]:
+                lead, lat, lng, source = located[idx]
+                stops.append({**lead, "route_order": len(stops) + 1, "route_lat": lat, "route_lng": lng, "coord_source": source})
+        distance = sum(math.hypot(xs[a] - xs[b], ys[a] - ys[b]) for a, b in zip(order, order[1:]))
+        return {"stops": stops, "unrouted": unrouted, "distance_km": round(distance, 2), "maps_urls": self.maps_urls(stops)}
+
+    def _solve(self, xs, ys, start=None):
+        n = len(xs)
+        if n <= 2:
+            return list(range(n))
+        tree = _KDTree(xs, ys)
+
+        # Candidate moves only consider each stop's nearest neighbours
+        neigh = [[j for _, j in tree.nearest(xs[i], ys[i], k=self.neighbours, exclude=i)] for i in range(n)]
+
+        # Nearest-neighbour seed, starting closest to the rep's start point
+        # (or at the stop farthest from the middle, since open routes end on the edges)
+        if start:
+            current = tree.nearest(*start, k=1)[0][1]
+        else:
+            mx, my = sum(xs) / n, sum(ys) / n
+            current = max(range(n), key=lambda i: (xs[i] - mx) ** 2 + (ys[i] - my) ** 2)
+        route = [current]
+        tree.remove(current)
+        for _ in range(n - 1):
+            nxt = tree.nearest(xs[current], ys[current], k=1)[0][1]
+            tree.remove(nxt)
+            route.append(nxt)
+            current = nxt
+
+        # The cap only covers improvement, so a slow index or seed never starves 2-opt/Or-opt
+        deadline = time.perf_counter() + self.time_cap
+
+        def d(a, b):
+            if a is None or b is None:
+                return 0.0 # Open route: no cost to start or end anywhere
+            return math.hypot(xs[a] - xs[b], ys[a] - ys[b])
+
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = self._two_opt(route, neigh, d, deadline)
+            improved = self._or_opt(route, neigh, d, deadline) or improved
+        return route
+
+    @staticmethod
+    def _two_opt(route, neigh, d, deadline, eps=1e-9):
+        n = len(route)
+        pos = [0] * n
+        for idx, node in enumerate(route):
+            pos[node] = idx
+        improved = False
+        for i in range(n - 1):
+            if time.perf_counter() >= deadline:
+                break
+            a, b = route[i], route[i + 1]
+            for c in neigh[a]:
+                j = pos[c]
+                if j > i + 1:
+                    # Reverse route[i+1..j]: edges (a,b),(c,e) -> (a,c),(b,e)
+                    e = route[j + 1] if j + 1 < n else None
+                    if d(a, c) + d(b, e) < d(a, b) + d(c, e) - eps:
+                        route[i + 1:j + 1] = route[i + 1:j + 1][::-1]
+                        for k in range(i + 1, j + 1):
+                            pos[route[k]] = k
+                        improved = True
+                        break
+                elif j < i:
+                    # Reverse route[j+1..i]: edges (c,e),(a,b) -> (c,a),(e,b)
+                    e = route[j + 1]
+                    if d(c, a) + d(e, b) < d(c, e) + d(a, b) - eps:
+                        route[j + 1:i + 1] = route[j + 1:i + 1][::-1]
+                        for k in range(j + 1, i + 1):
+                            pos[route[k]] = k
+                        improved = True
+                        break
+        return improved
+
+    @staticmethod
+    def _or_opt(route, neigh, d, deadline, eps=1e-9):
+        improved = False
+        pos = {node: idx for idx, node in enumerate(route)}
+        for seg_len in (1, 2, 3):
+            i = 0
+            while i + seg_len <= len(route):
+                if time.perf_counter() >= deadline:
+                    return improved
+                n = len(route)
+                seg = route[i:i + seg_len]
+                prev = route[i - 1] if i > 0 else None
+                nxt = route[i + seg_len] if i + seg_len < n else None
+                removal_gain = d(prev, seg[0]) + d(seg[-1], nxt) - (d(prev, nxt) if prev is not None and nxt is not None else 0.0)
+                best = None
+                for c in neigh[seg[0]] + neigh[seg[-1]]:
+                    p = pos[c]
+                    if i - 1 <= p < i + seg_len:
+                        continue # Same place or inside the segment
+                    succ = route[p + 1] if p + 1 < n else None
+                    if succ in seg:
+                        continue
+                    base = d(c, succ) if succ is not None else 0.0
+                    for oriented in (seg, seg[::-1]):
+                        cost = d(c, oriented[0]) + d(oriented[-1], succ) - base
+                        if cost < removal_gain - eps and (best is None or cost < best[0]):
+                            best = (cost, c, oriented)
+                if best:
+                    _, c, oriented = best
+                    rest = route[:i] + route[i + seg_len:]
+                    at = rest.index(c) + 1
+                    route[:] = rest[:at] + oriented + rest[at:]
+                    pos = {node: idx for idx, node in enumerate(route)}
+                    improved = True
+                else:
+                    i += 1
+        return improved
+
+    def maps_urls(self, stops):
+        """Splits the ordered stops into Google Maps multi-stop direction links (each leg starts where the last ended)."""
+        urls = []
+        step = self.MAX_STOPS_PER_MAPS_URL - 1
+        for start in range(0, max(len(stops) - 1, 1), step):
+            leg = stops[start:start + self.MAX_STOPS_PER_MAPS_URL]
+            coords = [f"{s['route_lat']:.6f},{s['route_lng']:.6f}" for s in leg]
+            params = {"api": 1, "origin": coords[0], "destination": coords[-1], "travelmode": self.travel_mode}
+            if len(coords) > 2:
+                params["waypoints"] = "|".join(coords[1:-1])
+            urls.append(f"https://www.google.com/maps/dir/?{urlencode(params)}")
+        return urls
+
+# Example usage:
+# planner = WalkInRoutePlanner(time_cap=0.5)
+# route = planner.plan(df_display.to_dict("records"))
+# for url in route["maps_urls"]:
+#     print(url)
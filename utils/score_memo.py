@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+
+class ScoredViewCache:
+    """
+    Bounded LRU memo of scored display frames, keyed by territory data version,
+    filter selections and rep name. A narrower filter set is served by slicing a
+    cached superset instead of rescoring, since scoring is per row.
+    Cached frames are shared between reruns and must be treated as read-only.
+    """
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "derived": 0, "misses": 0}
+
+    @staticmethod
+    def make_key(data_version, industries, compliance_tags, postal_codes, rep_name):
+        # Order of multiselect picks doesn't change the result, so normalize it away
+        return (data_version, tuple(sorted(industries)), tuple(sorted(compliance_tags)),
+                tuple(sorted(postal_codes)), rep_name)
+
+    @staticmethod
+    def _is_superset(cached_key, key):
+        """True if every row matching key's filters also matches cached_key's filters."""
+        if cached_key[0] != key[0] or cached_key[4] != key[4]: # Same data version and rep
+            return False
+        for cached_sel, sel in zip(cached_key[1:4], key[1:4]):
+            if not cached_sel:
+                continue # No filter on this dimension: everything was scored
+            if not sel or not set(sel) <= set(cached_sel):
+                return False
+        return True
+
+    def put(self, key, df):
+        with self._lock:
+            self._entries[key] = df
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key, row_index=None):
+        """
+        Returns the cached frame for key, or one sliced from a cached superset
+        (needs row_index, the index of the filtered rows). None on a miss.
+        """
+        with self._lock:
+            df = self._entries.get(key)
+            if df is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return df
+            if row_index is None:
+                return None
+            # Prefer the smallest superset so the slice is cheapest
+            supersets = [cached for cached_key, cached in self._entries.items() if self._is_superset(cached_key, key)]
+        for cached in sorted(supersets, key=len):
+            if row_index.isin(cached.index).all():
+                derived = cached.loc[row_index]
+                self.put(key, derived)
+                with self._lock:
+                    self.stats["derived"] += 1
+                return derived
+        return None
+
+    def get_or_compute(self, key, row_index, compute):
+        """Returns the memoized frame for key, scoring via compute() only on a true miss."""
+        df = self.get(key, row_index)
+        if df is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            df = compute()
+            self.put(key, df)
+        return df
+
+# Example usage:
+# memo = ScoredViewCache(max_entries=32)
+# key = memo.make_key(data_version, ["Meat Processing"], [], ["T2A1B2"], "Sam")
+# df_display = memo.get_or_compute(key, df_filtered.index, lambda: score(df_filtered))
@@ -0,0 +1,82 @@
+import re # For extracting postal codes
+import pandas as pd
+
+# --- Helper Function for Postal Code Extraction ---
+def extract_postal_code(address):
+    if not isinstance(address, str):
+        return None
+    # Canadian Postal Code Regex (allows for formats like T2X 1Y4 or T2X1Y4)
+    match = re.search(r'[ABCEGHJKLMNPRSTVXY]\d[A-Z]\s?\d[A-Z]\d', address.upper())
+    return match.group(0).replace(" ", "") if match else None # Return normalized (no space)
+
+class TerritoryLoader:
+    """
+    Runs the full fetch -> merge -> classify pipeline for one territory.
+    Kept free of Streamlit calls so it can run in a background thread;
+    progress messages go through the `progress` callback instead.
+    """
+    def __init__(self, naics_mapper, google_scraper, registry_fetcher, merger, quota_planner=None, radius=10000):
+        self.naics_mapper = naics_mapper
+        self.google_scraper = google_scraper
+        self.registry_fetcher = registry_fetcher
+        self.merger = merger
+        self.quota_planner = quota_planner
+        self.radius = radius
+
+    def load(self, postal_prefixes, location, call_budget=None, progress=print, warn=print):
+        """
+        Fetches leads from Google (broadly) and Registry, merges them,
+        classifies using NAICS map, and returns a DataFrame.
+        Network errors are raised to the caller.
+        """
+        # Google Scraping (Broad) - Radius can be adjusted
+        google_leads = self.google_scraper.search_businesses_broadly(location, radius=self.radius, planner=self.quota_planner, call_budget=call_budget,
+                                                                     classifier=self.naics_mapper) # Quota-planned broad search
+        progress(f"Found {len(google_leads)} potential leads from Google.") # Progress update
+
+        # Registry Fetching
+        registry_leads = self.registry_fetcher.fetch_by_postal(list(postal_prefixes))
+        progress(f"Found {len(registry_leads)} potential leads from Calgary Registry.") # Progress update
+
+        # Merge & Deduplicate
+        progress("Merging and deduplicating leads...")
+        combined_leads = self.merger.merge(google_leads, registry_leads)
+        progress(f"Total unique leads after merging: {len(combined_leads)}")
+
+        if not combined_leads:
+            warn("⚠️ No leads found for the specified territory.")
+            return pd.DataFrame()
+
+        # Classify, Add Compliance, and Extract Postal Codes
+        progress("Classifying leads by industry (NAICS)...")
+        processed_leads = []
+        for lead in combined_leads:
+            # Ensure essential fields exist
+            lead_text = f"{lead.get('business_name', '')} {lead.get('address', '')}"
+            naics_code, industry, compliance_tags = self.naics_mapper.guess_naics_from_text(lead_text, name=lead.get('business_name') or '') # Fuzzy fallback scores the name only
+
+            lead['naics_code'] = naics_code
+            lead['industry'] = industry if industry else "Unknown" # Default to Unknown if None
+            # Get additional details based on guessed NAICS
+            naics_details = self.naics_mapper.get_details_from_naics(naics_code) if naics_code else None
+            lead['compliance'] = naics_details.get('compliance', []) if naics_details else [] # Store as list
+            lead['awrv_tier'] = naics_details.get('awrv_tier', 'Unknown') if naics_details else 'Unknown'
+
+            # Standardize/Extract Postal Code
+            if 'postal_code' not in lead or not lead['postal_code']:
+                 lead['postal_code'] = extract_postal_code(lead.get('address',''))
+
+            processed_leads.append(lead)
+
+        df = pd.DataFrame(processed_leads)
+        # Ensure key columns exist, even if empty after processing
+        required_cols = ["business_name", "address", "postal_code", "industry", "compliance", "naics_code", "awrv_tier", "maps_link", "source"]
+        for col in required_cols:
+            if col not in df.columns:
+                df[col] = None if col != 'compliance' else pd.Series([[] for _ in range(len(df))]) # Initialize compliance as empty list
+
+        return df
+
+# Example usage:
+# loader = TerritoryLoader(NAICSKeywordMap(), GooglePlacesScraper(), CalgaryRegistryFetcher(), LeadMerger())
+# df = loader.load(("T1Y", "T2A"), "51.0447,-114.0719")